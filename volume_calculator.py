@@ -6,150 +6,426 @@ Author: Mar Canet (mar.canet@gmail.com) - September 2012-2023
 Description: Calculate volume and mass of STL models (binary and ASCII), NIfTI, and DICOM files.
 '''
 
+import array
+import io
+import logging
+import mmap
+import os
+import re
 import struct
 import sys
-import re
 import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import cached_property, partial
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Size of a binary STL facet record: normal, three vertices (12 float32) and a
+# uint16 attribute byte count
+_STL_RECORD_SIZE = 50
+# Triangle count following the 80-byte binary header
+_STL_COUNT = struct.Struct('<I')
+# Coordinate text of an ASCII STL 'vertex x y z' line
+_VERTEX_COORDS_RE = re.compile(rb'\n\s*vertex\s+([^\n]*)')
+
+_CM3_TO_INCH3 = 0.0610237441
+# Errors a missing, unreadable or malformed STL file can raise while loading
+_STL_ERRORS = (OSError, ValueError, IndexError, struct.error)
+# Smallest mesh worth compiling the Numba kernel for
+_JIT_MIN_TRIANGLES = 100000
+# Triangles per vectorised NumPy block
+_BLOCK_SIZE = 131072
+# Smallest mesh worth spreading the NumPy blocks over a thread pool
+_PARALLEL_MIN_TRIANGLES = 500000
+# Scale factor from six times the summed tetrahedron volumes in mm^3 to cm^3
+_SIXFOLD_MM3_TO_CM3 = 1.0 / 6000.0
+
+def _sum_signed_volumes_py(coords, origin):
+    # Pure-Python fallback over a flat x1, y1, z1, ..., z3 coordinate sequence: six times
+    # the summed signed volumes, with each facet unpacked straight into locals and
+    # taken relative to origin, the same apex the NumPy and Numba kernels use
+    ox, oy, oz = origin
+    acc = 0.0
+    it = iter(coords)
+    for x1, y1, z1, x2, y2, z2, x3, y3, z3 in zip(it, it, it, it, it, it, it, it, it):
+        x1, y1, z1 = x1 - ox, y1 - oy, z1 - oz
+        x2, y2, z2 = x2 - ox, y2 - oy, z2 - oz
+        x3, y3, z3 = x3 - ox, y3 - oy, z3 - oz
+        acc += x1 * (y2 * z3 - z2 * y3) + y1 * (z2 * x3 - x2 * z3) + z1 * (x2 * y3 - y2 * x3)
+    return acc
+
+def _sum_double_areas_py(coords):
+    # Pure-Python fallback over the same flat layout: twice the summed facet areas
+    acc = 0.0
+    it = iter(coords)
+    for x1, y1, z1, x2, y2, z2, x3, y3, z3 in zip(it, it, it, it, it, it, it, it, it):
+        ax, ay, az = x2 - x1, y2 - y1, z2 - z1
+        bx, by, bz = x3 - x1, y3 - y1, z3 - z1
+        cx, cy, cz = ay * bz - az * by, az * bx - ax * bz, ax * by - ay * bx
+        acc += (cx * cx + cy * cy + cz * cz)**0.5
+    return acc
+
+if np is not None:
+    # Full binary STL facet record, _STL_RECORD_SIZE bytes; only the vertices are kept
+    _STL_RECORD_DTYPE = np.dtype([
+        ('normal', '<f4', (3,)),
+        ('vertices', '<f4', (3, 3)),
+        ('attr', '<u2'),
+    ])
+
+    def _block_normals(block):
+        # Transpose the block into nine contiguous coordinate columns x1, y1, ..., z3
+        # so the arithmetic streams through memory instead of striding across the
+        # (n, 3, 3) facets. Returns p1 and the area normal (p2 - p1) x (p3 - p1)
+        x1, y1, z1, x2, y2, z2, x3, y3, z3 = np.ascontiguousarray(block.reshape(-1, 9).T)
+        ax, ay, az = x2 - x1, y2 - y1, z2 - z1
+        bx, by, bz = x3 - x1, y3 - y1, z3 - z1
+        return x1, y1, z1, ay * bz - az * by, az * bx - ax * bz, ax * by - ay * bx
+
+    def _block_sixfold_volume(block, origin):
+        # Signed tetrahedron volume p1 . (p2 x p3), which equals p1 . ((p2 - p1) x (p3 - p1)),
+        # summed over the block; operands stay float32 and only the reduction
+        # accumulates in float64. Vertices are taken relative to origin, a point on
+        # the mesh, because far from (0, 0, 0) the float32 products would lose the
+        # volume to cancellation
+        x1, y1, z1, cx, cy, cz = _block_normals(block - origin)
+        return float((x1 * cx + y1 * cy + z1 * cz).sum(dtype=np.float64))
+
+    def _block_double_area(block):
+        # |(p2 - p1) x (p3 - p1)| summed over the block
+        _, _, _, cx, cy, cz = _block_normals(block)
+        return float(np.sqrt(cx * cx + cy * cy + cz * cz).sum(dtype=np.float64))
+
+    def _block_volume_and_area(block, origin):
+        # Both sums from the one area normal per facet
+        x1, y1, z1, cx, cy, cz = _block_normals(block - origin)
+        return np.array([(x1 * cx + y1 * cy + z1 * cz).sum(dtype=np.float64),
+                         np.sqrt(cx * cx + cy * cy + cz * cz).sum(dtype=np.float64)])
+
+# Numba is imported on first use only: loading it takes longer than NumPy needs
+# to measure a small mesh. None until tried, then the compiled kernel or False
+_volume_and_area = None
+
+def _jit_kernel():
+    global _volume_and_area
+    if _volume_and_area is None:
+        try:
+            from numba import njit, prange
+        except ImportError:
+            _volume_and_area = False
+            return _volume_and_area
+
+        @njit(parallel=True, fastmath=True, cache=True, boundscheck=False)
+        def kernel(triangles, origin):
+            # Single fused pass over the mesh: returns six times the signed volume,
+            # p1 . (p2 x p3), and twice the surface area, |(p2 - p1) x (p3 - p1)|.
+            # Vertices are taken relative to origin (float64), as in _block_sixfold_volume
+            ox, oy, oz = origin[0], origin[1], origin[2]
+            volume = 0.0
+            area = 0.0
+            for i in prange(triangles.shape[0]):
+                x1, y1, z1 = triangles[i, 0, 0] - ox, triangles[i, 0, 1] - oy, triangles[i, 0, 2] - oz
+                x2, y2, z2 = triangles[i, 1, 0] - ox, triangles[i, 1, 1] - oy, triangles[i, 1, 2] - oz
+                x3, y3, z3 = triangles[i, 2, 0] - ox, triangles[i, 2, 1] - oy, triangles[i, 2, 2] - oz
+                volume += x1 * (y2 * z3 - z2 * y3) + y1 * (z2 * x3 - x2 * z3) + z1 * (x2 * y3 - y2 * x3)
+                ax, ay, az = x2 - x1, y2 - y1, z2 - z1
+                bx, by, bz = x3 - x1, y3 - y1, z3 - z1
+                cx, cy, cz = ay * bz - az * by, az * bx - ax * bz, ax * by - ay * bx
+                area += (cx * cx + cy * cy + cz * cz) ** 0.5
+            return volume, area
+
+        _volume_and_area = kernel
+    return _volume_and_area
+
+# Printing materials as (ID, name, density in g/cm^3)
+_MATERIALS = (
+    (1, 'ABS', 1.04),
+    (2, 'PLA', 1.25),
+    (3, '3k CFRP', 1.79),
+    (4, 'Plexiglass', 1.18),
+    (5, 'Alumide', 1.36),
+    (6, 'Aluminum', 2.68),
+    (7, 'Brass', 8.6),
+    (8, 'Bronze', 9.0),
+    (9, 'Copper', 9.0),
+    (10, 'Gold_14K', 13.6),
+    (11, 'Gold_18K', 15.6),
+    (12, 'Polyamide_MJF', 1.01),
+    (13, 'Polyamide_SLS', 0.95),
+    (14, 'Rubber', 1.2),
+    (15, 'Silver', 10.26),
+    (16, 'Steel', 7.86),
+    (17, 'Titanium', 4.41),
+    (18, 'Resin', 1.2),
+)
+# Case-insensitive name -> ID index, so name lookups don't scan the table
+_MATERIAL_IDS_BY_NAME = {name.lower(): key for key, name, _ in _MATERIALS}
 
 class materialsFor3DPrinting:
-    def __init__(self):
-        self.materials_dict = {
-            1: {'name': 'ABS', 'mass': 1.04},
-            2: {'name': 'PLA', 'mass': 1.25},
-            3: {'name': '3k CFRP', 'mass': 1.79},
-            4: {'name': 'Plexiglass', 'mass': 1.18},
-            5: {'name': 'Alumide', 'mass': 1.36},
-            6: {'name': 'Aluminum', 'mass': 2.68},
-            7: {'name': 'Brass', 'mass': 8.6},
-            8: {'name': 'Bronze', 'mass': 9.0},
-            9: {'name': 'Copper', 'mass': 9.0},
-            10: {'name': 'Gold_14K', 'mass': 13.6},
-            11: {'name': 'Gold_18K', 'mass': 15.6},
-            12: {'name': 'Polyamide_MJF', 'mass': 1.01},
-            13: {'name': 'Polyamide_SLS', 'mass': 0.95},
-            14: {'name': 'Rubber', 'mass': 1.2},
-            15: {'name': 'Silver', 'mass': 10.26},
-            16: {'name': 'Steel', 'mass': 7.86},
-            17: {'name': 'Titanium', 'mass': 4.41},
-            18: {'name': 'Resin', 'mass': 1.2}
-        }
-        
+    @cached_property
+    def materials_dict(self):
+        return {key: {'name': name, 'mass': mass} for key, name, mass in _MATERIALS}
+
     def get_material_mass(self, material_identifier):
         if material_identifier is None:
             return 1  # Default mass (density) value if no material is specified
         elif isinstance(material_identifier, int) and material_identifier in self.materials_dict:
             return self.materials_dict[material_identifier]['mass']
         elif isinstance(material_identifier, str):
-            for key, value in self.materials_dict.items():
-                if value['name'].lower() == material_identifier.lower():
-                    return value['mass']
+            material_id = _MATERIAL_IDS_BY_NAME.get(material_identifier.lower())
+            if material_id is not None:
+                return self.materials_dict[material_id]['mass']
             raise ValueError(f"Invalid material name: {material_identifier}")
         else:
             raise ValueError(f"Invalid material identifier: {material_identifier}")
 
     def list_materials(self):
-        for key, value in self.materials_dict.items():
-            print(f"{key} = {value['name']}")
+        for key, name, _ in _MATERIALS:
+            print(f"{key} = {name}")
 
 class STLUtils:
     def __init__(self):
-        self.f = None
         self.is_binary_file = None
-        self.triangles = []
+        # Facet coordinates: an (N, 3, 3) float32 array with NumPy, otherwise a flat
+        # array of x1, y1, z1, ..., z3 values, 9 per facet
+        self.vertices = []
+        self._sixfold_volume_cache = None
+        self._double_area_cache = None
+        self._triangles_cache = None
+        # (path, mtime, size) of the file currently loaded
+        self._loaded_key = None
+
+    @property
+    def triangles(self):
+        """Facets as ((x, y, z), (x, y, z), (x, y, z)) tuples, built on first access."""
+        if self._triangles_cache is None:
+            if np is not None and isinstance(self.vertices, np.ndarray):
+                self._triangles_cache = [(tuple(p1), tuple(p2), tuple(p3)) for p1, p2, p3 in self.vertices.tolist()]
+            else:
+                it = iter(self.vertices)
+                self._triangles_cache = [((x1, y1, z1), (x2, y2, z2), (x3, y3, z3))
+                                         for x1, y1, z1, x2, y2, z2, x3, y3, z3 in zip(it, it, it, it, it, it, it, it, it)]
+        return self._triangles_cache
 
     def is_binary(self, file):
         with open(file, 'rb') as f:
-            header = f.read(80).decode(errors='replace')
-            return not header.startswith('solid')
+            return _is_binary_prelude(f.read(84), os.fstat(f.fileno()).st_size)
 
     def read_ascii_triangle(self, lines, index):
-        p1 = list(map(float, re.findall(r"[-+]?\d*\.\d+|\d+", lines[index + 1])))
-        p2 = list(map(float, re.findall(r"[-+]?\d*\.\d+|\d+", lines[index + 2])))
-        p3 = list(map(float, re.findall(r"[-+]?\d*\.\d+|\d+", lines[index + 3])))
-        return self.signedVolumeOfTriangle(p1, p2, p3)
-
-    def signedVolumeOfTriangle(self, p1, p2, p3):
-        v321 = p3[0] * p2[1] * p1[2]
-        v231 = p2[0] * p3[1] * p1[2]
-        v312 = p3[0] * p1[1] * p2[2]
-        v132 = p1[0] * p3[1] * p2[2]
-        v213 = p2[0] * p1[1] * p3[2]
-        v123 = p1[0] * p2[1] * p3[2]
-        return (1.0 / 6.0) * (-v321 + v231 + v312 - v132 - v213 + v123)
-
-    def unpack(self, sig, l):
-        s = self.f.read(l)
-        return struct.unpack(sig, s)
-
-    def read_triangle(self):
-        n = self.unpack("<3f", 12)
-        p1 = self.unpack("<3f", 12)
-        p2 = self.unpack("<3f", 12)
-        p3 = self.unpack("<3f", 12)
-        self.unpack("<h", 2)
+        # lines[index] is 'facet normal ...', lines[index + 1] is 'outer loop', then
+        # three well-formed 'vertex x y z' lines
+        p1 = list(map(float, lines[index + 2].split()[1:4]))
+        p2 = list(map(float, lines[index + 3].split()[1:4]))
+        p3 = list(map(float, lines[index + 4].split()[1:4]))
         return (p1, p2, p3)
 
-    def read_length(self):
-        length = struct.unpack("@i", self.f.read(4))
-        return length[0]
-
-    def read_header(self):
-        self.f.seek(self.f.tell() + 80)
+    def signedVolumeOfTriangle(self, p1, p2, p3):
+        # p1 . (p2 x p3) / 6: 9 multiplies instead of the 18 of the expanded determinant
+        cx = p2[1] * p3[2] - p2[2] * p3[1]
+        cy = p2[2] * p3[0] - p2[0] * p3[2]
+        cz = p2[0] * p3[1] - p2[1] * p3[0]
+        return (p1[0] * cx + p1[1] * cy + p1[2] * cz) / 6.0
 
     def cm3_To_inch3Transform(self, v):
-        return v * 0.0610237441
+        return v * _CM3_TO_INCH3
 
     def loadSTL(self, infilename):
-        self.is_binary_file = self.is_binary(infilename)
-        self.triangles = []
-        try:
+        # Reloading an unchanged file keeps the parsed vertices and cached sums
+        st = os.stat(infilename)
+        key = (os.path.abspath(infilename), st.st_mtime_ns, st.st_size)
+        if key == self._loaded_key:
+            return
+        self._loaded_key = None
+        self.vertices = []
+        self._sixfold_volume_cache = None
+        self._double_area_cache = None
+        self._triangles_cache = None
+        # One handle serves both the format check and the parsing
+        with open(infilename, 'rb') as f:
+            prelude = f.read(84)
+            self.is_binary_file = _is_binary_prelude(prelude, os.fstat(f.fileno()).st_size)
             if self.is_binary_file:
-                self.f = open(infilename, "rb")
-                self.read_header()
-                l = self.read_length()
-                print("total triangles:", l)
-                for _ in range(l):
-                    self.triangles.append(self.read_triangle())
+                self._load_binary(f, prelude)
             else:
-                with open(infilename, 'r') as f:
-                    lines = f.readlines()
-                i = 0
-                while i < len(lines):
-                    if lines[i].strip().startswith('facet'):
-                        self.triangles.append(self.read_ascii_triangle(lines, i))
-                        i += 7  # Skip to next facet
-                    else:
-                        i += 1
-        except Exception as e:
-            print(f"Error: {e}")
-            self.triangles = []
+                f.seek(0)
+                self._load_ascii(f)
+        self._loaded_key = key
 
-    def calculateVolume(self, unit, material_mass):
-        totalVolume = sum(self.signedVolumeOfTriangle(p1, p2, p3) for p1, p2, p3 in self.triangles) / 1000
-        totalMass = totalVolume * material_mass
+    def _load_binary(self, f, prelude):
+        if len(prelude) < 84:
+            raise ValueError(f"Truncated STL file: expected an 84-byte header, found {len(prelude)} bytes")
+        l = _STL_COUNT.unpack_from(prelude, 80)[0]
+        logger.info("total triangles: %d", l)
+        if np is not None:
+            # Map the file and view the facet records in place, then copy only the
+            # vertices out into one contiguous (l, 3, 3) array; the 50-byte records
+            # are never materialised in memory
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                found = (len(mm) - 84) // _STL_RECORD_SIZE
+                if found < l:
+                    raise ValueError(f"Truncated STL file: expected {l} triangles, found {found}")
+                records = np.frombuffer(mm, dtype=_STL_RECORD_DTYPE, count=l, offset=84)
+                # Always copy: for 0 or 1 facets the field view is already contiguous,
+                # and a view would keep the mapping alive past the with block
+                self.vertices = records['vertices'].copy()
+                del records
+        else:
+            # Without NumPy, gather the 36 vertex bytes of every 50-byte record into
+            # one flat float32 array (9 coordinates per triangle) instead of
+            # building a tuple per vertex
+            data = memoryview(f.read(_STL_RECORD_SIZE * l))
+            if len(data) != _STL_RECORD_SIZE * l:
+                raise ValueError(f"Truncated STL file: expected {l} triangles, found {len(data) // _STL_RECORD_SIZE}")
+            self.vertices = array.array('f', b''.join([data[o + 12:o + 48] for o in range(0, len(data), _STL_RECORD_SIZE)]))
+            if sys.byteorder == 'big':
+                self.vertices.byteswap()
 
-        if totalMass <= 0:
-            print('Total mass could not be calculated')
+    def _load_ascii(self, f):
+        if np is not None:
+            # Pull the coordinate text of every vertex line out of the raw bytes and
+            # let NumPy tokenise and convert all of it in one call, 9 values per facet
+            coords = b' '.join(_VERTEX_COORDS_RE.findall(f.read()))
+            coords = np.fromstring(coords, dtype=np.float32, sep=' ')
+            if len(coords) % 9:
+                raise ValueError(f"Malformed ASCII STL file: {len(coords)} vertex coordinates is not a multiple of 9")
+            self.vertices = coords.reshape(-1, 3, 3)
+            logger.info("total triangles: %d", len(self.vertices))
         else:
-            print('Total mass:', totalMass, 'g')
+            with io.TextIOWrapper(f) as text:
+                lines = text.readlines()
+            self.vertices = array.array('d')
+            i = 0
+            while i < len(lines):
+                if lines[i].strip().startswith('facet'):
+                    for p in self.read_ascii_triangle(lines, i):
+                        self.vertices.extend(p[:3])
+                    i += 7  # Skip to next facet
+                else:
+                    i += 1
+            logger.info("total triangles: %d", len(self.vertices) // 9)
+
+    def _use_jit(self):
+        # Numba's compile step costs far more than NumPy needs for a small mesh
+        return (np is not None and isinstance(self.vertices, np.ndarray)
+                and len(self.vertices) >= _JIT_MIN_TRIANGLES and bool(_jit_kernel()))
 
-            if unit == "cm":
-                print("Total volume:", totalVolume, "cm^3")
+    def _origin(self):
+        # Any point works as the apex of the signed-volume tetrahedra of a closed
+        # mesh; the first vertex is free to find and keeps the products small. Every
+        # backend uses it, so open meshes measure the same everywhere too
+        if np is not None and isinstance(self.vertices, np.ndarray):
+            if len(self.vertices):
+                return self.vertices[0, 0]
+            return np.zeros(3, dtype=np.float32)
+        return tuple(self.vertices[:3]) or (0.0, 0.0, 0.0)
+
+    def _reduce_blocks(self, kernel, initial=0.0):
+        # Sum kernel(block) onto initial over blocks small enough to keep the NumPy
+        # temporaries cache-sized. NumPy releases the GIL inside its loops, so on a
+        # large mesh threads share the blocks without copying the vertices to other
+        # processes
+        blocks = [self.vertices[start:start + _BLOCK_SIZE] for start in range(0, len(self.vertices), _BLOCK_SIZE)]
+        if len(self.vertices) >= _PARALLEL_MIN_TRIANGLES and (os.cpu_count() or 1) > 1:
+            with ThreadPoolExecutor() as executor:
+                return sum(executor.map(kernel, blocks), initial)
+        return sum(map(kernel, blocks), initial)
+
+    def _measure_jit(self):
+        # Volume and area come out of the same Numba pass, so keep both
+        self._sixfold_volume_cache, self._double_area_cache = _jit_kernel()(self.vertices, self._origin().astype(np.float64))
+
+    def _sixfold_volume(self):
+        # Every kernel returns six times the volume in mm^3, so the /6 and
+        # mm^3 -> cm^3 factors are applied once by the caller. Results are kept
+        # until the next loadSTL
+        if self._sixfold_volume_cache is None:
+            if self._use_jit():
+                self._measure_jit()
+            elif np is not None and isinstance(self.vertices, np.ndarray):
+                self._sixfold_volume_cache = self._reduce_blocks(partial(_block_sixfold_volume, origin=self._origin()))
             else:
-                totalVolume = self.cm3_To_inch3Transform(totalVolume)
-                print("Total volume:", totalVolume, "inch^3")
+                self._sixfold_volume_cache = _sum_signed_volumes_py(self.vertices, self._origin())
+        return self._sixfold_volume_cache
+
+    def _double_area(self):
+        if self._double_area_cache is None:
+            if self._use_jit():
+                self._measure_jit()
+            elif np is not None and isinstance(self.vertices, np.ndarray):
+                self._double_area_cache = self._reduce_blocks(_block_double_area)
+            else:
+                self._double_area_cache = _sum_double_areas_py(self.vertices)
+        return self._double_area_cache
+
+    def volume_and_area(self):
+        """Return (volume in cm^3, surface area in cm^2) from one pass over the facets."""
+        if self._sixfold_volume_cache is None or self._double_area_cache is None:
+            if self._use_jit():
+                self._measure_jit()
+            elif np is not None and isinstance(self.vertices, np.ndarray):
+                self._sixfold_volume_cache, self._double_area_cache = map(float, self._reduce_blocks(partial(_block_volume_and_area, origin=self._origin()), np.zeros(2)))
+        # Without NumPy the two sums are separate loops anyway
+        return self._sixfold_volume() * _SIXFOLD_MM3_TO_CM3, 0.5 * self._double_area() / 100
+
+    def calculateVolume(self, unit, material_mass):
+        totalVolume = self._sixfold_volume() * _SIXFOLD_MM3_TO_CM3
+        _print_volume_report(totalVolume, totalVolume * material_mass, unit)
+
+    @staticmethod
+    def calculate_many(paths, material_mass=1, workers=None):
+        """Load and measure several STL files in parallel worker processes.
+
+        Returns a list of (path, volume in cm^3, mass in g, error) tuples in input
+        order. error is None on success; for a file that could not be read it is
+        the error message, and volume and mass are None.
+        """
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return [(path, None, None, error) if error is not None
+                    else (path, totalVolume, totalVolume * material_mass, None)
+                    for path, totalVolume, error in executor.map(_volume_of_file, paths, chunksize=4)]
 
     def surf_area(self):
-        area = 0
-        for p1, p2, p3 in self.triangles:
-            ax, ay, az = p2[0] - p1[0], p2[1] - p1[1], p2[2] - p1[2]
-            bx, by, bz = p3[0] - p1[0], p3[1] - p1[1], p3[2] - p1[2]
-            cx, cy, cz = ay * bz - az * by, az * bx - ax * bz, ax * by - ay * bx
-            area += 0.5 * (cx * cx + cy * cy + cz * cz)**0.5
-        areaCm2 = area / 100
+        areaCm2 = 0.5 * self._double_area() / 100
         print("Total area:", areaCm2, "cm^2")
         return areaCm2
         
+def _is_binary_prelude(prelude, size):
+    # Binary STL prelude: 80-byte header followed by the triangle count as a
+    # little-endian uint32. ASCII files start with 'solid', but so do the headers
+    # some exporters write into binary files, so trust the file size when it
+    # matches the declared triangle count exactly
+    if not prelude.lstrip().startswith(b'solid'):
+        return True
+    return len(prelude) == 84 and size == 84 + _STL_RECORD_SIZE * _STL_COUNT.unpack_from(prelude, 80)[0]
+
+
+def _print_volume_report(totalVolume, totalMass, unit):
+    if totalMass <= 0:
+        print('Total mass could not be calculated')
+    else:
+        print('Total mass:', totalMass, 'g')
+
+        if unit == "cm":
+            print("Total volume:", totalVolume, "cm^3")
+        else:
+            print("Total volume:", totalVolume * _CM3_TO_INCH3, "inch^3")
+
+def _volume_of_file(path):
+    # Worker for STLUtils.calculate_many; each process parses with its own STLUtils.
+    # Read errors are returned, not raised, so one bad file doesn't abort the batch
+    stl = STLUtils()
+    try:
+        stl.loadSTL(path)
+        return path, stl._sixfold_volume() * _SIXFOLD_MM3_TO_CM3, None
+    except _STL_ERRORS as e:
+        return path, None, str(e)
+
 class VolumeDataProcessor:
     def __init__(self, file_path, file_type):
         self.file_path = file_path
@@ -205,63 +481,98 @@ class VolumeDataProcessor:
     def generate_isosurface(self, data):
         verts, faces, _, _ = measure.marching_cubes(data, level=0.5)
         surface_mesh = mesh.Mesh(np.zeros(faces.shape[0], dtype=mesh.Mesh.dtype))
-        for i, f in enumerate(faces):
-            for j in range(3):
-                surface_mesh.vectors[i][j] = verts[f[j],:]
+        # Gather every face's three vertices in one fancy-indexing pass
+        surface_mesh.vectors[:] = verts[faces]
         return surface_mesh
     
     # Calculate surface area of the mesh
     def calculate_surface_area(self, surface_mesh):
-        area = 0.0
-        for f in surface_mesh.vectors:
-            p0, p1, p2 = f
-            a = np.linalg.norm(p1 - p0)
-            b = np.linalg.norm(p2 - p1)
-            c = np.linalg.norm(p0 - p2)
-            s = (a + b + c) / 2.0
-            area += (s * (s - a) * (s - b) * (s - c)) ** 0.5
-        return area
+        # Half the cross-product norm of every face at once, rather than Heron's
+        # formula, which loses precision on sliver faces and can go negative (NaN)
+        # on degenerate ones
+        faces = surface_mesh.vectors
+        cross = np.cross(faces[:, 1] - faces[:, 0], faces[:, 2] - faces[:, 0])
+        return 0.5 * float(np.linalg.norm(cross, axis=1).sum(dtype=np.float64))
 
     # Calculate volume of the mesh
     def calculate_volume(self, surface_mesh):
-        volume = 0.0
-        for f in surface_mesh.vectors:
-            p1, p2, p3 = f
-            v321 = p3[0] * p2[1] * p1[2]
-            v231 = p2[0] * p3[1] * p1[2]
-            v312 = p3[0] * p1[1] * p2[2]
-            v132 = p1[0] * p3[1] * p2[2]
-            v213 = p2[0] * p1[1] * p3[2]
-            v123 = p1[0] * p2[1] * p3[2]
-            volume += (-v321 + v231 + v312 - v132 - v213 + v123) / 6.0
-        return abs(volume)
+        # Signed tetrahedron volumes p1 . (p2 x p3) / 6 of every face at once, in
+        # float64 so the products stay accurate away from the origin
+        faces = surface_mesh.vectors.astype(np.float64)
+        volume = np.einsum('ij,ij->', faces[:, 0], np.cross(faces[:, 1], faces[:, 2]))
+        return abs(float(volume)) / 6.0
         
+class _PrecompileAction(argparse.Action):
+    # Like --version: compile the Numba kernel into its on-disk cache and exit,
+    # so later runs skip the JIT warm-up
+    def __init__(self, option_strings, dest=argparse.SUPPRESS, default=argparse.SUPPRESS, help=None):
+        super().__init__(option_strings, dest, nargs=0, default=default, help=help)
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        kernel = _jit_kernel()
+        if not kernel:
+            parser.exit(1, "Numba is not installed; nothing to precompile.\n")
+        kernel(np.zeros((1, 3, 3), dtype=np.float32), np.zeros(3))
+        parser.exit(0, "Numba kernel compiled and cached.\n")
+
 def main():
     parser = argparse.ArgumentParser(description='Calculate volume or surface area of STL models.')
-    parser.add_argument('filename', help='Path to the file')
-    parser.add_argument('calculation', choices=['volume', 'area'], help='Choose between calculating volume or surface area')
+    parser.add_argument('filename', nargs='+', help='Path to the file (several STL files are processed in parallel)')
+    parser.add_argument('calculation', choices=['volume', 'area', 'both'], help='Choose between calculating volume, surface area or both')
     parser.add_argument('--unit', choices=['cm', 'inch'], default='cm', help='Unit for the volume calculation (default: cm)')
     parser.add_argument('--material', type=int, choices=range(1, 19),default=2, help='Material ID for mass calculation')
     parser.add_argument('--filetype', choices=['stl', 'nii', 'dcm'], default='stl', help='Type of the input file: stl, nii, dcm')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Print progress details such as the triangle count')
+    parser.add_argument('--precompile', action=_PrecompileAction, help='Compile and cache the optional Numba kernel, then exit')
 
     args = parser.parse_args()
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO, format='%(message)s')
+    several = len(args.filename) > 1
 
     if args.filetype == 'stl':
-        mySTLUtils = STLUtils()
-        mySTLUtils.loadSTL(args.filename)
-        if args.calculation == 'volume':
-            material_mass = materialsFor3DPrinting().get_material_mass(args.material)
-            mySTLUtils.calculateVolume(args.unit, material_mass)
-        elif args.calculation == 'area':
-            mySTLUtils.surf_area()
+        material_mass = materialsFor3DPrinting().get_material_mass(args.material)
+        # A file that can't be read is reported under its path and the rest are
+        # still measured; the exit status records that something failed
+        failed = False
+        if args.calculation == 'volume' and several:
+            for path, totalVolume, totalMass, error in STLUtils.calculate_many(args.filename, material_mass):
+                print(f"{path}:")
+                if error is None:
+                    _print_volume_report(totalVolume, totalMass, args.unit)
+                else:
+                    print(f"Error: {error}")
+                    failed = True
+        else:
+            for filename in args.filename:
+                if several:
+                    print(f"{filename}:")
+                try:
+                    mySTLUtils = STLUtils()
+                    mySTLUtils.loadSTL(filename)
+                    if args.calculation == 'both':
+                        # Measure both in one pass; the reports below read the cached sums
+                        mySTLUtils.volume_and_area()
+                    if args.calculation in ('volume', 'both'):
+                        mySTLUtils.calculateVolume(args.unit, material_mass)
+                    if args.calculation in ('area', 'both'):
+                        mySTLUtils.surf_area()
+                except _STL_ERRORS as e:
+                    print(f"Error: {e}")
+                    failed = True
+        if failed:
+            sys.exit(1)
     elif args.filetype in ['nii', 'dcm']:
-        volumeDataProcessor = VolumeDataProcessor(args.filename, args.filetype)
-        data = volumeDataProcessor.read_volume_data()
-        surface_mesh = volumeDataProcessor.generate_isosurface(data)
-        if args.calculation == 'volume':
-            print('Volume:', volumeDataProcessor.calculate_volume(surface_mesh), 'units^3')
-        elif args.calculation == 'area':
-            print('Surface area:', volumeDataProcessor.calculate_surface_area(surface_mesh), 'units^2')
+        for filename in args.filename:
+            if several:
+                print(f"{filename}:")
+            volumeDataProcessor = VolumeDataProcessor(filename, args.filetype)
+            data = volumeDataProcessor.read_volume_data()
+            surface_mesh = volumeDataProcessor.generate_isosurface(data)
+            if args.calculation in ('volume', 'both'):
+                print('Volume:', volumeDataProcessor.calculate_volume(surface_mesh), 'units^3')
+            if args.calculation in ('area', 'both'):
+                print('Surface area:', volumeDataProcessor.calculate_surface_area(surface_mesh), 'units^2')
 
 if __name__ == '__main__':
     main()